@@ -2,99 +2,96 @@
 import sys
 import argparse
 from pathlib import Path
-from faster_whisper import WhisperModel
-
-def transcribe_audio(audio_file: str, model: WhisperModel):
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
+from typing import Iterable, Iterator
+from faster_whisper import BatchedInferencePipeline
+from faster_whisper.transcribe import Word
+import whisper_server
+from transcribe_common import ends_sentence, log, with_lookahead, add_model_args, load_or_connect
+
+def emit_sentences(words: Iterable[Word], max_pause_duration: float = 0.7) -> Iterator[str]:
+    """
+    Groups a stream of words into sentences. A sentence ends when:
+    1. The word ends with punctuation ('.', '?', '!' or their CJK forms).
+    2. There is a long pause after the word.
+    3. It's the last word of the entire transcription.
+    """
+    sentence_buffer = []
+    for word, following in with_lookahead(words, 1):
+        sentence_buffer.append(word.word)
+        if (
+            ends_sentence(word.word) or
+            not following or
+            following[0].start - word.end > max_pause_duration
+        ):
+            # .strip() cleans up any leading/trailing spaces.
+            yield "".join(sentence_buffer).strip()
+            sentence_buffer = []
+
+def emit_paragraphs(sentences: Iterable[str], sentences_per_paragraph: int = 5) -> Iterator[str]:
+    """Groups sentences into paragraphs; the last one takes whatever sentences are left."""
+    sentences = iter(sentences)
+    while paragraph := list(islice(sentences, sentences_per_paragraph)):
+        yield " ".join(paragraph)
+
+def transcribe_audio(audio_file: str, model: BatchedInferencePipeline | whisper_server.RemoteModel, beam_size: int = 1, language: str | None = None):
     """
     Transcribes an audio file and generates a well-formatted text file with paragraphs.
+    Paragraphs are written out as soon as they are complete, while Whisper is still decoding.
     """
     audio_path = Path(audio_file)
     if not audio_path.is_file():
-        print(f"❌ Error: File not found at {audio_path}", file=sys.stderr)
+        log(f"❌ Error: File not found at {audio_path}", file=sys.stderr)
         return
 
-    print(f"\n▶️ Starting transcription for: {audio_path.name}")
+    log(f"\n▶️ Starting transcription for: {audio_path.name}")
 
-    print("🤖 Transcribing... (This will take some time)")
-    full_text = ""
+    log("🤖 Transcribing... (This will take some time)")
+    output_path = audio_path.with_suffix(".txt")
+    output_file = None
     try:
         # We use word_timestamps=True to detect pauses between words,
         # which helps in structuring the text into natural sentences.
         segments, info = model.transcribe(
-            str(audio_path),
+            # Absolute, so whisper_server.py can open it from its own working directory.
+            str(audio_path.resolve()),
+            batch_size=8,
             word_timestamps=True,
+            beam_size=beam_size,
+            best_of=1,
+            temperature=0,
+            language=language,
             vad_filter=True,
-            vad_parameters=dict(min_speech_duration_ms=100)
+            vad_parameters=dict(min_speech_duration_ms=200, min_silence_duration_ms=500, threshold=0.5)
         )
 
-        print(f"🌍 Detected language '{info.language}' with {info.language_probability:.2f} probability.")
-
-        all_words = []
-        for segment in segments:
-            if segment.words:
-                all_words.extend(segment.words)
-
-        if not all_words:
-            print("⚠️ No speech detected in the audio.")
-            return
-
-        # --- Part 1: Group words into sentences based on punctuation and pauses ---
-        sentences = []
-        sentence_buffer = []
-        # A pause of 0.7 seconds between words will also trigger a new sentence.
-        max_pause_duration = 0.7
-
-        for i, word in enumerate(all_words):
-            sentence_buffer.append(word.word)
-            word_text = word.word.strip()
-
-            is_last_word = (i == len(all_words) - 1)
-            next_word_starts_at = all_words[i+1].start if not is_last_word else 0
-
-            # Conditions to end a sentence:
-            # 1. The word ends with punctuation ('.', '?', '!').
-            # 2. There is a long pause after the word.
-            # 3. It's the last word of the entire transcription.
-            if (
-                word_text.endswith(('.', '?', '!')) or
-                (not is_last_word and next_word_starts_at - word.end > max_pause_duration) or
-                is_last_word
-            ):
-                # Join the words in the buffer to form a sentence.
-                # .strip() cleans up any leading/trailing spaces.
-                sentences.append("".join(sentence_buffer).strip())
-                sentence_buffer = []
-
-        # --- Part 2: Group sentences into paragraphs ---
-        if sentences:
-            paragraphs = []
-            current_paragraph = []
-            # You can adjust this number for longer or shorter paragraphs.
-            sentences_per_paragraph = 5
+        log(f"🌍 Detected language '{info.language}' with {info.language_probability:.2f} probability.")
 
-            for i, sentence in enumerate(sentences):
-                current_paragraph.append(sentence)
-                # Create a new paragraph after a certain number of sentences
-                # or if it's the very last sentence.
-                if len(current_paragraph) >= sentences_per_paragraph or i == len(sentences) - 1:
-                    paragraphs.append(" ".join(current_paragraph))
-                    current_paragraph = []
-            
-            # Join paragraphs with two newlines for clear separation.
-            full_text = "\n\n".join(paragraphs)
+        # Segments are decoded lazily, so words flow through the sentence and
+        # paragraph grouping without ever being collected into one big list.
+        words = chain.from_iterable(segment.words for segment in segments if segment.words)
+        for paragraph in emit_paragraphs(emit_sentences(words)):
+            if output_file is None:
+                output_file = output_path.open("w", encoding="utf-8")
+            else:
+                # Separate paragraphs with two newlines.
+                output_file.write("\n\n")
+            output_file.write(paragraph)
 
     except Exception as e:
-        print(f"❌ An error occurred during transcription: {e}", file=sys.stderr)
+        log(f"❌ An error occurred during transcription: {e}", file=sys.stderr)
+        if output_file is not None:
+            output_file.close()
+            output_path.unlink()
         return
 
-    # --- Part 3: Save the result to a .txt file ---
-    if full_text:
-        output_path = audio_path.with_suffix(".txt")
-        output_path.write_text(full_text, encoding='utf-8')
-        print("--- Transcription Complete ---")
-        print(f"✅ Text file saved to: {output_path}")
+    if output_file is not None:
+        output_file.close()
+        log("--- Transcription Complete ---")
+        log(f"✅ Text file saved to: {output_path}")
     else:
-        print("❌ Transcription failed or produced no output.")
+        log("⚠️ No speech detected in the audio.")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -106,22 +103,40 @@ if __name__ == "__main__":
         type=str,
         help="One or more paths to your audio files (e.g., input1.flac input2.wav)."
     )
+    add_model_args(parser)
+    parser.add_argument(
+        "--beam-size",
+        type=int,
+        default=1,
+        help="Beam size for decoding. 1 (greedy) is fastest; 5 is Whisper's slower default."
+    )
+    parser.add_argument(
+        "--language",
+        type=str,
+        default=None,
+        help="Language code of the speech (e.g., en, de). Skips automatic language detection."
+    )
     args = parser.parse_args()
     
-    # You can change the model size. Options are: "tiny", "base", "small", "medium", "large-v3".
+    # You can change the model size with --model. Options are: "tiny", "base", "small", "medium", "large-v3".
     # Larger models are more accurate but slower and use more memory.
-    model_size = "small"
-    print(f"⚙️ Loading model '{model_size}'... (This may take a moment on first run)")
-    try:
-        # Using "cpu" and "int8" is a good baseline for running on most computers.
-        transcription_model = WhisperModel(model_size, device="cpu", compute_type="int8")
-    except Exception as e:
-        print(f"❌ Error loading model: {e}", file=sys.stderr)
-        sys.exit(1)
+    # Up to two files are transcribed at once: while one is in the decoder, the other
+    # can use the encoder. Each model worker gets its share of the physical cores, so
+    # a single file keeps all of them.
+    parallel_files = min(2, len(args.audio_paths))
+    new_model = load_or_connect(args, parallel_files)
 
     total_files = len(args.audio_paths)
-    for i, audio_file_path in enumerate(args.audio_paths):
-        print(f"\n{'='*20} Processing file {i+1} of {total_files} {'='*20}")
-        transcribe_audio(audio_file_path, model=transcription_model)
+
+    def process_file(job):
+        i, audio_file_path = job
+        log(f"\n{'='*20} Processing file {i+1} of {total_files} {'='*20}")
+        transcribe_audio(
+            audio_file_path, model=new_model(),
+            beam_size=args.beam_size, language=args.language
+        )
+
+    with ThreadPoolExecutor(max_workers=parallel_files) as executor:
+        list(executor.map(process_file, enumerate(args.audio_paths)))
 
     print("\n🎉 All files processed.")
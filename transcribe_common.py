@@ -0,0 +1,135 @@
+# Helpers shared by transcribe_audio.py, transcribe_video.py, whisper_server.py
+# and the YouTube downloaders, so a fix here reaches all of them.
+import os
+import sys
+import argparse
+import threading
+from pathlib import Path
+from collections import deque
+from typing import Callable, Iterable, Iterator
+from faster_whisper import WhisperModel, BatchedInferencePipeline
+from faster_whisper.utils import download_model
+import ctranslate2
+import psutil
+
+# Characters that end a sentence, including full-width CJK punctuation.
+SENTENCE_END = frozenset('.?!。！？')
+
+def ends_sentence(word_text: str) -> bool:
+    """Checks whether a word ends with sentence-final punctuation."""
+    if word_text and word_text[-1].isspace():
+        word_text = word_text.rstrip()
+    return bool(word_text) and word_text[-1] in SENTENCE_END
+
+print_lock = threading.Lock()
+
+def log(*args, **kwargs):
+    """print() that keeps lines from files transcribed in parallel from interleaving."""
+    with print_lock:
+        print(*args, **kwargs)
+
+def prefetch_model(model_size_or_path: str) -> str:
+    """
+    Resolves the model to its local CTranslate2 directory, using the Hugging Face cache
+    without a network round-trip once it has been downloaded, and asks the OS to read
+    the weights into the page cache before the model is loaded.
+    """
+    if os.path.isdir(model_size_or_path):
+        model_path = model_size_or_path
+    else:
+        try:
+            model_path = download_model(model_size_or_path, local_files_only=True)
+        except Exception:
+            # Not cached yet: download it once.
+            model_path = download_model(model_size_or_path)
+
+    if hasattr(os, "posix_fadvise"):
+        for weights_file in Path(model_path).glob("*.bin"):
+            fd = os.open(weights_file, os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            finally:
+                os.close(fd)
+    return model_path
+
+def default_compute_type() -> str:
+    """Picks int8_float32 when this CPU supports it, falling back to plain int8."""
+    supported = ctranslate2.get_supported_compute_types("cpu")
+    return "int8_float32" if "int8_float32" in supported else "int8"
+
+def with_lookahead(items: Iterable, size: int) -> Iterator[tuple]:
+    """
+    Yields each item together with a deque of up to `size` items that follow it.
+    An empty deque means the item is the last one.
+    """
+    window = deque()
+    for item in items:
+        window.append(item)
+        if len(window) > size:
+            yield window.popleft(), window
+    while window:
+        yield window.popleft(), window
+
+def add_model_args(parser: argparse.ArgumentParser):
+    """Adds the --model, --compute-type and --threads options every transcriber takes."""
+    parser.add_argument(
+        "--model",
+        type=str,
+        default="small",
+        help="Model size (e.g., tiny, base, small) or path to a converted CTranslate2 model directory."
+    )
+    parser.add_argument(
+        "--compute-type",
+        type=str,
+        default=None,
+        help="CTranslate2 compute type (e.g., int8, int8_float32). Defaults to the best int8 variant for this CPU."
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="Number of CPU threads per transcription worker. Defaults to the physical cores split across workers."
+    )
+
+def load_model(args: argparse.Namespace, parallel_files: int) -> tuple[WhisperModel, str]:
+    """
+    Loads the model named by the add_model_args() options for `parallel_files` files at once,
+    each model worker with its share of the physical cores. Returns the model and the compute
+    type it uses; exits if the model can't be loaded.
+    """
+    compute_type = args.compute_type or default_compute_type()
+    physical_cores = psutil.cpu_count(logical=False) or os.cpu_count()
+    cpu_threads = args.threads or max(1, physical_cores // parallel_files)
+    print(f"⚙️ Loading model '{args.model}' ({compute_type})... (This may take a moment on first run)")
+    try:
+        # Using "cpu" with an int8 compute type is a good baseline for running on most computers.
+        model = WhisperModel(
+            prefetch_model(args.model), device="cpu", compute_type=compute_type,
+            cpu_threads=cpu_threads, num_workers=parallel_files
+        )
+    except Exception as e:
+        print(f"❌ Error loading model: {e}", file=sys.stderr)
+        sys.exit(1)
+    return model, compute_type
+
+def load_or_connect(args: argparse.Namespace, parallel_files: int) -> Callable:
+    """
+    Returns a function that gives the model to transcribe one file with: the running
+    whisper_server.py if it has the same model and compute type loaded, otherwise a
+    model loaded here.
+    """
+    # Imported here: whisper_server imports this module.
+    import whisper_server
+
+    # --threads only tunes a model loaded here, so passing it always loads locally.
+    if not args.threads:
+        remote_model = whisper_server.connect(args.model, args.compute_type or default_compute_type())
+        if remote_model is not None:
+            print("⚙️ Using the model loaded by whisper_server.py")
+            return lambda: remote_model
+
+    model, _ = load_model(args, parallel_files)
+    # The batched pipeline runs VAD-split chunks through the model in batches.
+    # It keeps per-call state, so every file gets its own pipeline around the
+    # shared (thread-safe) model. The server does the same on its side.
+    return lambda: BatchedInferencePipeline(model=model)
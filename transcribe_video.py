@@ -2,117 +2,147 @@
 import sys
 import argparse
 from pathlib import Path
-from faster_whisper import WhisperModel
-from pydub import AudioSegment
-import tempfile
-import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from typing import Iterable, Iterator
+from faster_whisper import BatchedInferencePipeline
+from faster_whisper.transcribe import Word
+import numpy as np
+import whisper_server
+from transcribe_common import ends_sentence, log, with_lookahead, add_model_args, load_or_connect
+import subprocess
 
 def format_timestamp(seconds: float) -> str:
     """Converts seconds into the SRT timestamp format HH:MM:SS,ms."""
     assert seconds >= 0, "non-negative timestamp expected"
-    milliseconds = round(seconds * 1000.0)
-    hours, milliseconds = divmod(milliseconds, 3_600_000)
-    minutes, milliseconds = divmod(milliseconds, 60_000)
+    milliseconds = int(seconds * 1000.0 + 0.5)
     seconds, milliseconds = divmod(milliseconds, 1_000)
-    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}"
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%02d:%02d:%02d,%03d" % (hours, minutes, seconds, milliseconds)
 
-def transcribe_video_final(video_file: str, model: WhisperModel):
+def emit_cues(words: Iterable[Word], max_chars: int = 45, max_pause_duration: float = 0.8) -> Iterator[str]:
+    """
+    Groups a stream of words into numbered SRT cues. A cue ends on sentence-final
+    punctuation, on a long pause, or once the line exceeds max_chars - unless one
+    of the next three words ends the sentence anyway.
+    """
+    srt_counter = 1
+    line_texts = []
+    line_start = 0.0
+    line_length = -1
+    def prepare(word):
+        text = word.word.strip()
+        return word, text, ends_sentence(text)
+
+    # Each word is stripped and classified once, as it enters the look-ahead window,
+    # so the break test below only compares numbers and flags.
+    prepared_words = map(prepare, words)
+    for (word, text, is_terminal), following in with_lookahead(prepared_words, 3):
+        if not line_texts:
+            line_start = word.start
+        line_texts.append(text)
+        # Running length of " ".join(line_texts).
+        line_length += len(text) + 1
+        is_last_word_overall = not following
+
+        should_break = (
+            is_terminal or
+            (not is_last_word_overall and following[0][0].start - word.end > max_pause_duration) or
+            (line_length > max_chars and not any(ahead[2] for ahead in following))
+        )
+
+        if is_last_word_overall or should_break:
+            start_time = format_timestamp(line_start)
+            end_time = format_timestamp(word.end)
+            text_to_write = " ".join(line_texts)
+            yield f"{srt_counter}\n{start_time} --> {end_time}\n{text_to_write}\n\n"
+            srt_counter += 1
+            line_texts = []
+            line_length = -1
+
+def extract_audio(video_path: Path) -> np.ndarray:
+    """Decodes the audio track to 16kHz mono float32 samples with a single ffmpeg pipe."""
+    command = [
+        "ffmpeg", "-loglevel", "error", "-i", str(video_path),
+        "-vn", "-f", "s16le", "-ac", "1", "-ar", "16000", "-"
+    ]
+    proc = subprocess.run(command, capture_output=True, check=True)
+    return np.frombuffer(proc.stdout, np.int16).astype(np.float32) / 32768.0
+
+def transcribe_video_final(video_file: str, model: BatchedInferencePipeline | whisper_server.RemoteModel, beam_size: int = 1, language: str | None = None, prompt: str = "Verbatim, include fillers."):
     """
     Transcribes a video file and generates a grammatically-aware,
     word-level synchronized SRT subtitle file.
     """
     video_path = Path(video_file)
     if not video_path.is_file():
-        print(f"❌ Error: File not found at {video_path}", file=sys.stderr)
+        log(f"❌ Error: File not found at {video_path}", file=sys.stderr)
         return
 
-    print(f"\n▶️ Starting transcription for: {video_path.name}")
+    log(f"\n▶️ Starting transcription for: {video_path.name}")
 
-    print("🔊 Extracting audio from video...")
-    temp_audio_path = None
-    try:
-        audio_segment = AudioSegment.from_file(video_path, format=video_path.suffix.lstrip('.'))
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp_audio_file:
-            temp_audio_path = tmp_audio_file.name
-            audio_segment.export(temp_audio_path, format="wav", parameters=["-ar", "16000", "-ac", "1"])
-    except Exception as e:
-        print(f"❌ Error extracting audio from {video_path.name}: {e}", file=sys.stderr)
-        if temp_audio_path and os.path.exists(temp_audio_path):
-            os.remove(temp_audio_path)
-        return
+    if isinstance(model, whisper_server.RemoteModel):
+        # The server decodes the file itself; sending the path avoids pickling
+        # hundreds of MB of samples through the socket.
+        audio = str(video_path.resolve())
+    else:
+        log("🔊 Extracting audio from video...")
+        try:
+            audio = extract_audio(video_path)
+        except subprocess.CalledProcessError as e:
+            log(f"❌ Error extracting audio from {video_path.name}: {e.stderr.decode('utf-8', errors='replace').strip()}", file=sys.stderr)
+            return
+        except Exception as e:
+            log(f"❌ Error extracting audio from {video_path.name}: {e}", file=sys.stderr)
+            return
 
-    print("🤖 Transcribing... (This will take some time)")
-    srt_content = ""
+    log("🤖 Transcribing... (This will take some time)")
+    segments, info = model.transcribe(
+        audio,
+        batch_size=8,
+        word_timestamps=True,
+        beam_size=beam_size,
+        best_of=1,
+        temperature=0,
+        language=language,
+        vad_filter=True,
+        vad_parameters=dict(min_speech_duration_ms=200, min_silence_duration_ms=500, threshold=0.5),
+        # The batched pipeline decodes every chunk independently anyway; the short prompt
+        # is the only context, and it is tokenized for every chunk.
+        condition_on_previous_text=False,
+        initial_prompt=prompt or None,
+        compression_ratio_threshold=2.4,
+        log_prob_threshold=-1.0
+    )
+    
+    log(f"🌍 Detected language '{info.language}' with {info.language_probability:.2f} probability.")
+    log(f"🕒 Estimated audio duration for transcription: {format_timestamp(info.duration)}")
+    
+    # Segments are decoded lazily; cues are written out as soon as they are
+    # complete instead of collecting every word of the video first.
+    words = chain.from_iterable(segment.words for segment in segments if segment.words)
+    output_path = video_path.with_suffix(".srt")
+    srt_file = None
     try:
-        verbatim_prompt = "The following is a raw, verbatim transcription, including all filler words like 'uhm' and 'ah'."
-        
-        segments, info = model.transcribe(
-            temp_audio_path,
-            word_timestamps=True,
-            vad_filter=True,
-            vad_parameters=dict(min_speech_duration_ms=50, threshold=0.4),
-            condition_on_previous_text=False,
-            initial_prompt=verbatim_prompt
-        )
-        
-        print(f"🌍 Detected language '{info.language}' with {info.language_probability:.2f} probability.")
-        print(f"🕒 Estimated audio duration for transcription: {format_timestamp(info.duration)}")
-        
-        all_words = []
-        for segment in segments:
-            all_words.extend(segment.words)
-
-        srt_counter = 1
-        max_chars = 45
-        max_pause_duration = 0.8
-        line_buffer = []
-
-        if all_words:
-            for i, word in enumerate(all_words):
-                line_buffer.append(word)
-                current_text = " ".join([w.word.strip() for w in line_buffer])
-                is_last_word_overall = (i == len(all_words) - 1)
-                
-                should_break = False
-                word_text = word.word.strip()
-
-                if word_text.endswith(('.', '?', '!')):
-                    should_break = True
-                elif not is_last_word_overall and (all_words[i+1].start - word.end > max_pause_duration):
-                    should_break = True
-                elif len(current_text) > max_chars:
-                    found_punctuation_ahead = False
-                    for j in range(1, 4):
-                        if (i + j) < len(all_words):
-                            next_word_text = all_words[i+j].word.strip()
-                            if next_word_text.endswith(('.', '?', '!')):
-                                found_punctuation_ahead = True
-                                break
-                    
-                    if not found_punctuation_ahead:
-                        should_break = True
-                
-                if is_last_word_overall or should_break:
-                    start_time = format_timestamp(line_buffer[0].start)
-                    end_time = format_timestamp(line_buffer[-1].end)
-                    text_to_write = " ".join([w.word.strip() for w in line_buffer])
-                    
-                    srt_content += f"{srt_counter}\n"
-                    srt_content += f"{start_time} --> {end_time}\n"
-                    srt_content += f"{text_to_write}\n\n"
-                    srt_counter += 1
-                    line_buffer = []
-    finally:
-        if temp_audio_path and os.path.exists(temp_audio_path):
-            os.remove(temp_audio_path)
-
-    if srt_content:
-        output_path = video_path.with_suffix(".srt")
-        output_path.write_text(srt_content, encoding='utf-8')
-        print("--- Transcription Complete ---")
-        print(f"✅ Subtitle file saved to: {output_path}")
+        for cue in emit_cues(words):
+            if srt_file is None:
+                # A large buffer turns the many small cue writes into a few big ones.
+                srt_file = output_path.open("w", encoding="utf-8", buffering=1 << 20)
+            srt_file.write(cue)
+    except BaseException:
+        # Don't leave a truncated subtitle file behind.
+        if srt_file is not None:
+            srt_file.close()
+            output_path.unlink()
+        raise
+
+    if srt_file is not None:
+        srt_file.close()
+        log("--- Transcription Complete ---")
+        log(f"✅ Subtitle file saved to: {output_path}")
     else:
-        print("❌ Transcription failed or produced no output.")
+        log("❌ Transcription failed or produced no output.")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -124,20 +154,44 @@ if __name__ == "__main__":
         type=str,
         help="One or more paths to your video files (e.g., input1.mp4 input2.mkv)."
     )
+    add_model_args(parser)
+    parser.add_argument(
+        "--beam-size",
+        type=int,
+        default=1,
+        help="Beam size for decoding. 1 (greedy) is fastest; 5 is Whisper's slower default."
+    )
+    parser.add_argument(
+        "--language",
+        type=str,
+        default=None,
+        help="Language code of the speech (e.g., en, de). Skips automatic language detection."
+    )
+    parser.add_argument(
+        "--prompt",
+        type=str,
+        default="Verbatim, include fillers.",
+        help="Initial prompt that steers the transcription style. Pass an empty string to disable it."
+    )
     args = parser.parse_args()
     
-    model_size = "small"
-    print(f"⚙️ Loading model '{model_size}'... (This may take a moment on first run)")
-    try:
-        transcription_model = WhisperModel(model_size, device="cpu", compute_type="int8")
-    except Exception as e:
-        print(f"❌ Error loading model: {e}", file=sys.stderr)
-        sys.exit(1)
+    # Up to two files are transcribed at once: while one is in the decoder, the other
+    # can use the encoder. Each model worker gets its share of the physical cores, so
+    # a single file keeps all of them.
+    parallel_files = min(2, len(args.video_paths))
+    new_model = load_or_connect(args, parallel_files)
 
-    # --- THIS LINE IS NOW FIXED ---
     total_files = len(args.video_paths)
-    for i, video_file_path in enumerate(args.video_paths):
-        print(f"\n{'='*20} Processing file {i+1} of {total_files} {'='*20}")
-        transcribe_video_final(video_file_path, model=transcription_model)
+
+    def process_file(job):
+        i, video_file_path = job
+        log(f"\n{'='*20} Processing file {i+1} of {total_files} {'='*20}")
+        transcribe_video_final(
+            video_file_path, model=new_model(),
+            beam_size=args.beam_size, language=args.language, prompt=args.prompt
+        )
+
+    with ThreadPoolExecutor(max_workers=parallel_files) as executor:
+        list(executor.map(process_file, enumerate(args.video_paths)))
 
     print("\n🎉 All files processed.")
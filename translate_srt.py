@@ -1,22 +1,122 @@
-import pysrt
+import srt
 import translators as ts
 import sys
 import os
 import re
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from transcribe_common import log
 
-def translate_srt_file_resilient(input_file, output_file, target_language='vi', batch_size=20):
+# Matches a "N_> text" marker at the start of a line. This regex is flexible, allowing for
+# different separators like '>', '.', ':', or '-' and variations in spacing, since translation
+# services tend to reformat the markers. [^\S\n] is whitespace that stays on the same line.
+MARKER_RE = re.compile(r'^[^\S\n]*(\d+)[^\S\n]*[_>.:\-][^\S\n]*(.*)', re.MULTILINE)
+
+def _clean_entry(text):
+    """Strips every line of a translated entry and the entry as a whole."""
+    return "\n".join(line.strip() for line in text.split('\n')).strip()
+
+def parse_numbered_block(translated_block):
+    """
+    Parses a translated numbered list back into a {index: text} dictionary.
+    Lines without a marker are continuations of the previous subtitle's text;
+    anything before the first marker is ignored.
+    """
+    translated_lines_dict = {}
+    previous = None
+    # One scan over the block: each entry runs from its marker to the start of the next one.
+    for match in MARKER_RE.finditer(translated_block):
+        if previous is not None:
+            text = previous.group(2) + translated_block[previous.end():match.start()]
+            translated_lines_dict[int(previous.group(1))] = _clean_entry(text)
+        previous = match
+
+    # Save the last subtitle, which runs to the end of the block
+    if previous is not None:
+        text = previous.group(2) + translated_block[previous.end():]
+        translated_lines_dict[int(previous.group(1))] = _clean_entry(text)
+    return translated_lines_dict
+
+class RateLimiter:
+    """
+    Allows at most `per_second` requests in any one-second window across all threads.
+    Each request takes a token from a semaphore, and the token is handed back a second later.
+    """
+    def __init__(self, per_second):
+        self._tokens = threading.Semaphore(per_second)
+
+    def wait(self):
+        self._tokens.acquire()
+        refill = threading.Timer(1.0, self._tokens.release)
+        refill.daemon = True
+        refill.start()
+
+def translate_batch(i, batch_texts, batch_number, target_language, limiter):
+    """
+    Translates one batch of subtitle texts and returns a {position: translated_text} dictionary.
+    Tries each engine on the whole numbered batch, then falls back to translating line by line.
+    """
+    translation_engines = ['google', 'bing']
+
+    # Format the batch as a numbered list. Example: "0_> Text 1\n1_> Text 2"
+    numbered_texts = [f"{j}_> {text}" for j, text in enumerate(batch_texts)]
+    text_to_translate = "\n".join(numbered_texts)
+
+    for engine in translation_engines:
+        try:
+            limiter.wait()
+            translated_block = ts.translate_text(text_to_translate, translator=engine, to_language=target_language)
+
+            translated_lines_dict = parse_numbered_block(translated_block)
+
+            # Integrity check: Did we get all our lines back?
+            if len(translated_lines_dict) != len(batch_texts):
+                # Batches run on several threads, so the dump goes out in one locked call
+                # to keep other batches' output and the progress bar out of the middle of it.
+                log(
+                    f"\n\n--- DEBUG: BATCH MISMATCH on engine '{engine}' (batch {batch_number}) ---\n"
+                    f"Expected {len(batch_texts)} subtitles, but parsed {len(translated_lines_dict)}.\n"
+                    "--- Original Numbered Text Sent ---\n"
+                    f"{text_to_translate}\n"
+                    "\n--- Raw Translated Block Received ---\n"
+                    f"{translated_block}\n"
+                    "--- Parsed Dictionary ---\n"
+                    f"{translated_lines_dict}\n"
+                    "-------------------------------------------\n"
+                )
+                raise ValueError(f"Mismatched line count in batch. Expected {len(batch_texts)}, got {len(translated_lines_dict)}")
+
+            log(f"\nBatch {batch_number} translated successfully with '{engine}'.")
+            return translated_lines_dict # Success
+
+        except Exception as e:
+            log(f"\nWarning: Batch {batch_number} failed with '{engine}' engine. Error: {e}. Trying next engine...")
+
+    # Fallback for if all engines fail on a batch
+    log(f"\nWarning: All engines failed for batch {batch_number}. Translating line-by-line as a final fallback.")
+    translated_lines_dict = {}
+    for sub_index, text in enumerate(batch_texts):
+        try:
+            limiter.wait()
+            translated_lines_dict[sub_index] = ts.translate_text(text, translator='google', to_language=target_language)
+        except Exception as line_e:
+            log(f"Could not translate line {i+sub_index+1}: '{text}'. Error: {line_e}")
+    return translated_lines_dict
+
+def translate_srt_file_resilient(input_file, output_file, target_language='vi', batch_size=20, max_workers=4):
     """
     Translates an SRT file using a highly resilient numbered-list batching method.
     This version includes a more flexible parser to handle reformatting by translation services.
+    Batches are sent concurrently, since each one mostly waits on the network.
     """
     if not os.path.exists(input_file):
         print(f"Error: The file '{input_file}' was not found.")
         return
 
     try:
-        subs = pysrt.open(input_file, encoding='utf-8')
+        with open(input_file, encoding='utf-8') as f:
+            subs = list(srt.parse(f.read()))
         total_subs = len(subs)
         
         print(f"File found: '{input_file}'")
@@ -24,92 +124,43 @@ def translate_srt_file_resilient(input_file, output_file, target_language='vi',
         
         start_time = datetime.now()
         
-        translation_engines = ['google', 'bing']
-        
-        for i in range(0, total_subs, batch_size):
-            batch = subs[i:i + batch_size]
-            batch_translated = False
-            
-            # Format the batch as a numbered list. Example: "0_> Text 1\n1_> Text 2"
-            numbered_texts = [f"{j}_> {sub.text}" for j, sub in enumerate(batch)]
-            text_to_translate = "\n".join(numbered_texts)
-
-            for engine in translation_engines:
-                try:
-                    translated_block = ts.translate_text(text_to_translate, translator=engine, to_language=target_language)
-                    
-                    # --- START: IMPROVED PARSING LOGIC ---
-                    translated_lines_dict = {}
-                    current_index = -1
-                    current_text_lines = []
-                    
-                    # This regex is more flexible, allowing for different separators like '>', '.', ':', or '-'
-                    # and variations in spacing.
-                    pattern = re.compile(r'^\s*(\d+)\s*[_>.:-]\s*(.*)')
-
-                    for line in translated_block.split('\n'):
-                        match = pattern.match(line)
-                        if match:
-                            # If a new marker is found, save the previously collected text
-                            if current_index != -1:
-                                translated_lines_dict[current_index] = "\n".join(current_text_lines).strip()
-                            
-                            # Start collecting text for the new index
-                            current_index = int(match.group(1))
-                            current_text_lines = [match.group(2).strip()]
-                        elif current_index != -1:
-                            # This line is a continuation of the previous subtitle's text
-                            current_text_lines.append(line.strip())
-                    
-                    # Save the last collected subtitle text after the loop finishes
-                    if current_index != -1:
-                        translated_lines_dict[current_index] = "\n".join(current_text_lines).strip()
-                    # --- END: IMPROVED PARSING LOGIC ---
-
-                    # Integrity check: Did we get all our lines back?
-                    if len(translated_lines_dict) != len(batch):
-                        print(f"\n\n--- DEBUG: BATCH MISMATCH on engine '{engine}' ---")
-                        print(f"Expected {len(batch)} subtitles, but parsed {len(translated_lines_dict)}.")
-                        print("--- Original Numbered Text Sent ---")
-                        print(text_to_translate)
-                        print("\n--- Raw Translated Block Received ---")
-                        print(translated_block)
-                        print("--- Parsed Dictionary ---")
-                        print(translated_lines_dict)
-                        print("-------------------------------------------\n")
-                        raise ValueError(f"Mismatched line count in batch. Expected {len(batch)}, got {len(translated_lines_dict)}")
+        # Keep the overall request rate where the old 0.2s delay between batches put it.
+        limiter = RateLimiter(per_second=5)
+        processed_count = 0
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(
+                    translate_batch, i, [sub.content for sub in subs[i:i + batch_size]],
+                    i // batch_size + 1, target_language, limiter
+                ): i
+                for i in range(0, total_subs, batch_size)
+            }
+
+            try:
+                for future in as_completed(futures):
+                    i = futures[future]
+                    batch = subs[i:i + batch_size]
+                    translated_lines_dict = future.result()
 
                     # Reassemble the batch in the correct order
                     for j, sub in enumerate(batch):
                         # Use .get() to avoid errors if an index is somehow still missing
                         # and fall back to original text.
-                        sub.text = translated_lines_dict.get(j, sub.text)
-
-                    batch_translated = True
-                    print(f"\nBatch {int(i/batch_size)+1} translated successfully with '{engine}'.")
-                    break # Success, move to the next batch
-
-                except Exception as e:
-                    print(f"\nWarning: Batch {int(i/batch_size)+1} failed with '{engine}' engine. Error: {e}. Trying next engine...")
-            
-            # Fallback for if all engines fail on a batch
-            if not batch_translated:
-                print(f"\nWarning: All engines failed for batch {int(i/batch_size)+1}. Translating line-by-line as a final fallback.")
-                for sub_index, sub in enumerate(batch):
-                    try:
-                        sub.text = ts.translate_text(sub.text, translator='google', to_language=target_language)
-                    except Exception as line_e:
-                        print(f"Could not translate line {i+sub_index+1}: '{sub.text}'. Error: {line_e}")
-
-            # Update progress bar
-            processed_count = min(i + batch_size, total_subs)
-            progress = processed_count / total_subs * 100
-            sys.stdout.write(f"\rProgress: [{'#' * int(progress / 2):<50}] {progress:.2f}%")
-            sys.stdout.flush()
-            
-            time.sleep(0.2) # Increased delay slightly to be safer
-
-        subs.save(output_file, encoding='utf-8')
+                        sub.content = translated_lines_dict.get(j, sub.content)
+
+                    # Update progress bar
+                    processed_count += len(batch)
+                    progress = processed_count / total_subs * 100
+                    log(f"\rProgress: [{'#' * int(progress / 2):<50}] {progress:.2f}%", end='', flush=True)
+            except BaseException:
+                # On Ctrl+C or an unexpected error, drop the batches that haven't been
+                # sent yet instead of waiting for the whole queue to drain.
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+
+        with open(output_file, 'w', encoding='utf-8') as f:
+            f.write(srt.compose(subs))
         
         end_time = datetime.now()
         duration = end_time - start_time
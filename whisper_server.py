@@ -0,0 +1,152 @@
+# Save this code as whisper_server.py
+# Keeps one Whisper model loaded in the background, so transcribe_audio.py and
+# transcribe_video.py don't pay the model load on every run.
+#
+# Start it once in its own terminal:  python whisper_server.py --model small
+# While it is running, both scripts send their work here instead of loading the model,
+# as long as they ask for the same --model and --compute-type and don't pass --threads.
+# Otherwise they load the model themselves, exactly as before.
+import os
+import sys
+import stat
+import secrets
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+from multiprocessing.connection import Listener, Client, AuthenticationError
+from faster_whisper import WhisperModel, BatchedInferencePipeline
+from transcribe_common import add_model_args, load_model
+
+def runtime_dir() -> Path:
+    """
+    Returns the private directory that holds the socket and its key. Raises PermissionError
+    if the directory already exists but belongs to someone else or other users can enter it.
+    """
+    base = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    run_dir = Path(base) / f"kuiche-{os.getuid()}"
+    run_dir.mkdir(mode=0o700, exist_ok=True)
+    # mkdir leaves an existing directory alone, so check what is actually there.
+    # lstat, so a symlink to someone else's directory is refused too.
+    st = os.lstat(run_dir)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) & 0o077:
+        raise PermissionError(f"{run_dir} must be a directory owned by you with mode 0700")
+    return run_dir
+
+# --- Client ---
+
+class RemoteModel:
+    """
+    Stands in for a BatchedInferencePipeline: transcribe() takes the same arguments,
+    but the work is done by the running server. The segments arrive all at once
+    when the server is done instead of one by one. Pass audio as an absolute path;
+    the server decodes it itself.
+    """
+    def __init__(self, address: str, authkey: bytes, model_spec: tuple[str, str]):
+        self.address = address
+        self.authkey = authkey
+        self.model_spec = model_spec
+
+    def transcribe(self, audio, **options):
+        with Client(self.address, family="AF_UNIX", authkey=self.authkey) as conn:
+            # The model spec goes along so a server restarted with another model refuses the job.
+            conn.send(("transcribe", self.model_spec, audio, options))
+            status, result = conn.recv()
+        if status == "error":
+            raise RuntimeError(f"whisper_server: {result}")
+        segments, info = result
+        return iter(segments), info
+
+def connect(model_size: str, compute_type: str) -> RemoteModel | None:
+    """
+    Returns a RemoteModel if a server is running with this model and compute type,
+    or None if the model has to be loaded locally.
+    """
+    if sys.platform == "win32":
+        return None
+    try:
+        run_dir = runtime_dir()
+        address = str(run_dir / "whisper.sock")
+        authkey = (run_dir / "whisper.key").read_bytes()
+        with Client(address, family="AF_UNIX", authkey=authkey) as conn:
+            conn.send(("info",))
+            status, loaded_spec = conn.recv()
+    except PermissionError as e:
+        print(f"⚠️ Not using whisper_server.py: {e}", file=sys.stderr)
+        return None
+    except (OSError, EOFError, AuthenticationError):
+        # No server running, or a stale socket or key from one that has stopped.
+        return None
+    if loaded_spec != (model_size, compute_type):
+        print(f"⚠️ whisper_server.py has '{loaded_spec[0]}' ({loaded_spec[1]}) loaded, not '{model_size}' ({compute_type}). Loading the model here instead.")
+        return None
+    return RemoteModel(address, authkey, loaded_spec)
+
+# --- Server ---
+
+def handle_connection(conn, model: WhisperModel, model_spec: tuple[str, str]):
+    """Answers one request. Each connection gets its own thread, so files are transcribed in parallel."""
+    with conn:
+        try:
+            kind, *request = conn.recv()
+        except EOFError:
+            return
+        try:
+            if kind == "info":
+                conn.send(("ok", model_spec))
+                return
+            if kind != "transcribe":
+                raise ValueError(f"unknown request '{kind}'")
+            requested_spec, audio, options = request
+            if requested_spec != model_spec:
+                raise ValueError(f"'{model_spec[0]}' ({model_spec[1]}) is loaded, not '{requested_spec[0]}' ({requested_spec[1]})")
+            # The batched pipeline keeps per-call state, so every request gets its own.
+            segments, info = BatchedInferencePipeline(model=model).transcribe(audio, **options)
+            conn.send(("ok", (list(segments), info)))
+        except Exception as e:
+            conn.send(("error", str(e)))
+
+def serve(model: WhisperModel, model_spec: tuple[str, str]):
+    run_dir = runtime_dir()
+    address = run_dir / "whisper.sock"
+    # A new key on every start. Clients must read it from the 0600 file to be let in,
+    # so only this user's processes can send (and receive) pickled data.
+    authkey = secrets.token_bytes(32)
+    fd = os.open(run_dir / "whisper.key", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as key_file:
+        os.fchmod(key_file.fileno(), 0o600)
+        key_file.write(authkey)
+    # A server that was killed leaves its socket file behind.
+    if address.exists():
+        address.unlink()
+    with Listener(str(address), family="AF_UNIX", authkey=authkey) as listener:
+        print(f"✅ Listening on {address}. Press Ctrl+C to stop.")
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, EOFError, ConnectionError):
+                # A client without the key, or one that hung up during the handshake.
+                continue
+            threading.Thread(target=handle_connection, args=(conn, model, model_spec), daemon=True).start()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Keep a Whisper model loaded for transcribe_audio.py and transcribe_video.py."
+    )
+    add_model_args(parser)
+    args = parser.parse_args()
+
+    if sys.platform == "win32":
+        print("❌ whisper_server.py needs Unix domain sockets, which aren't available on Windows.", file=sys.stderr)
+        sys.exit(1)
+
+    # Same split as the client scripts: two files at once, each worker with its share of the cores.
+    transcription_model, compute_type = load_model(args, parallel_files=2)
+
+    try:
+        serve(transcription_model, (args.model, compute_type))
+    except PermissionError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print("\n👋 Server stopped.")
@@ -6,22 +6,26 @@
 import sys
 import os
 import tempfile
+import shutil
 import subprocess
 from pathlib import Path
+import psutil
 import yt_dlp
+from yt_dlp.postprocessor import FFmpegPostProcessor
 from faster_whisper import WhisperModel
 from pydub import AudioSegment
+from transcribe_common import prefetch_model
 
 # --- Transcription Logic ---
 
 def format_timestamp(seconds: float) -> str:
     """Converts seconds into the SRT timestamp format HH:MM:SS,ms."""
     assert seconds >= 0, "non-negative timestamp expected"
-    milliseconds = round(seconds * 1000.0)
-    hours, milliseconds = divmod(milliseconds, 3_600_000)
-    minutes, milliseconds = divmod(milliseconds, 60_000)
+    milliseconds = int(seconds * 1000.0 + 0.5)
     seconds, milliseconds = divmod(milliseconds, 1_000)
-    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}"
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%02d:%02d:%02d,%03d" % (hours, minutes, seconds, milliseconds)
 
 def transcribe_video_final(video_file: str, model: WhisperModel):
     """
@@ -34,13 +38,20 @@ def transcribe_video_final(video_file: str, model: WhisperModel):
         return
 
     print(f"\n▶️ STEP 2: Starting transcription for: {video_path.name}")
-    print("🔊 Extracting audio from video...")
     temp_audio_path = None
+    prepared_audio_path = video_path.with_suffix(".wav")
+    if prepared_audio_path.is_file():
+        # download_video already had yt-dlp write a 16kHz mono WAV next to the video.
+        print("🔊 Using audio extracted during download...")
+        temp_audio_path = str(prepared_audio_path)
+    else:
+        print("🔊 Extracting audio from video...")
     try:
-        audio_segment = AudioSegment.from_file(video_file, format=video_path.suffix.lstrip('.'))
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp_audio_file:
-            temp_audio_path = tmp_audio_file.name
-            audio_segment.export(temp_audio_path, format="wav", parameters=["-ar", "16000", "-ac", "1"])
+        if not temp_audio_path:
+            audio_segment = AudioSegment.from_file(video_file, format=video_path.suffix.lstrip('.'))
+            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp_audio_file:
+                temp_audio_path = tmp_audio_file.name
+                audio_segment.export(temp_audio_path, format="wav", parameters=["-ar", "16000", "-ac", "1"])
     except Exception as e:
         print(f"❌ Error extracting audio from {video_path.name}: {e}", file=sys.stderr)
         if temp_audio_path and os.path.exists(temp_audio_path):
@@ -48,31 +59,44 @@ def transcribe_video_final(video_file: str, model: WhisperModel):
         return
 
     print("🤖 Transcribing... (This will take some time)")
-    srt_content = ""
+    output_path = video_path.with_suffix(".srt")
+    srt_file = None
+    srt_counter = 1
+    completed = False
     try:
-        verbatim_prompt = "The following is a raw, verbatim transcription, including all filler words like 'uhm' and 'ah'."
+        # Cues are written as soon as they are complete; the large buffer keeps
+        # that to a few big writes instead of one per cue.
+        srt_file = output_path.open("w", encoding="utf-8", buffering=1 << 20)
+        # A short prompt is cheaper to tokenize for every window. Earlier text is not
+        # fed back as context, so a misheard phrase can't get repeated from window to window.
+        verbatim_prompt = "Verbatim, include fillers."
         segments, info = model.transcribe(
             temp_audio_path, word_timestamps=True, vad_filter=True,
             vad_parameters=dict(min_speech_duration_ms=50, threshold=0.4),
-            condition_on_previous_text=False, initial_prompt=verbatim_prompt
+            condition_on_previous_text=False, initial_prompt=verbatim_prompt,
+            compression_ratio_threshold=2.4, log_prob_threshold=-1.0
         )
         print(f"🌍 Detected language '{info.language}' with {info.language_probability:.2f} probability.")
         
         all_words = [word for segment in segments for word in segment.words]
 
-        srt_counter, max_chars, max_pause_duration, line_buffer = 1, 45, 0.8, []
+        max_chars, max_pause_duration, line_buffer = 45, 0.8, []
+        # Length of " ".join() over the stripped words in line_buffer, kept up to date
+        # instead of re-joining the whole line for every word.
+        running_len = -1
         if all_words:
             for i, word in enumerate(all_words):
                 line_buffer.append(word)
-                current_text = " ".join([w.word.strip() for w in line_buffer])
+                word_text = word.word.strip()
+                running_len += len(word_text) + 1
                 is_last_word = (i == len(all_words) - 1)
                 
                 should_break = False
-                if word.word.strip().endswith(('.', '?', '!')):
+                if word_text.endswith(('.', '?', '!')):
                     should_break = True
                 elif not is_last_word and (all_words[i+1].start - word.end > max_pause_duration):
                     should_break = True
-                elif len(current_text) > max_chars:
+                elif running_len > max_chars:
                     if not any(w.word.strip().endswith(('.', '?', '!')) for w in all_words[i+1:i+4]):
                         should_break = True
                 
@@ -80,16 +104,21 @@ def transcribe_video_final(video_file: str, model: WhisperModel):
                     start_time = format_timestamp(line_buffer[0].start)
                     end_time = format_timestamp(line_buffer[-1].end)
                     text = " ".join([w.word.strip() for w in line_buffer])
-                    srt_content += f"{srt_counter}\n{start_time} --> {end_time}\n{text}\n\n"
+                    srt_file.write(f"{srt_counter}\n{start_time} --> {end_time}\n{text}\n\n")
                     srt_counter += 1
                     line_buffer = []
+                    running_len = -1
+        completed = True
     finally:
+        if srt_file is not None:
+            srt_file.close()
+            # An empty or half-written file must not reach the embedding step.
+            if not completed or srt_counter == 1:
+                output_path.unlink()
         if temp_audio_path and os.path.exists(temp_audio_path):
             os.remove(temp_audio_path)
 
-    if srt_content:
-        output_path = video_path.with_suffix(".srt")
-        output_path.write_text(srt_content, encoding='utf-8')
+    if srt_counter > 1:
         print("--- Transcription Complete ---")
         print(f"✅ Subtitle file saved to: {output_path}")
     else:
@@ -107,9 +136,14 @@ def embed_subtitles(video_path: str, srt_path: str):
     output_p = video_p.with_name(f"{video_p.stem}_subtitled{video_p.suffix}")
 
     print(f"\n▶️ STEP 3: Embedding subtitles into {video_p.name}")
+    # Stream-copy all of the video's tracks plus the subtitle track; only the
+    # subtitles are converted. +faststart puts the index at the front so the
+    # mp4 can be played while it is still streaming.
     command = [
         'ffmpeg', '-i', str(video_p), '-i', str(srt_p),
+        '-map', '0', '-map', '1:0',
         '-c', 'copy', '-c:s', 'mov_text', '-metadata:s:s:0', 'language=eng',
+        '-movflags', '+faststart',
         '-y', str(output_p)
     ]
 
@@ -119,9 +153,9 @@ def embed_subtitles(video_path: str, srt_path: str):
             command, check=True, capture_output=True, text=True, encoding='utf-8'
         )
         print("✅ Subtitles embedded successfully.")
-        os.remove(video_p)
-        os.remove(srt_p)
-        os.rename(output_p, video_p)
+        video_p.unlink()
+        srt_p.unlink()
+        shutil.move(output_p, video_p)
         print(f"✅ Final video saved to: {video_p}")
     except FileNotFoundError:
         print("\n❌ Error: 'ffmpeg' command not found.", file=sys.stderr)
@@ -134,6 +168,17 @@ def embed_subtitles(video_path: str, srt_path: str):
 
 # --- YouTube Download Logic ---
 
+class ExtractWavPP(FFmpegPostProcessor):
+    """
+    Writes a 16kHz mono WAV next to the finished video for the transcriber,
+    so it doesn't have to decode the whole file again with pydub.
+    """
+    def run(self, info):
+        video_path = Path(info['filepath'])
+        self.to_screen(f'Extracting audio for transcription from "{video_path.name}"')
+        self.run_ffmpeg(str(video_path), str(video_path.with_suffix('.wav')), ['-vn', '-ac', '1', '-ar', '16000'])
+        return [], info
+
 def download_video(url: str) -> str | None:
     """Downloads a YouTube video and returns the path to the final merged file."""
     print(f"▶️ STEP 1: Starting download for URL: {url}")
@@ -154,6 +199,7 @@ def download_video(url: str) -> str | None:
 
     try:
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            ydl.add_post_processor(ExtractWavPP(ydl), when='post_process')
             info_dict = ydl.extract_info(url, download=True)
             final_filepath = info_dict.get('filepath')
             if not final_filepath:
@@ -172,7 +218,11 @@ if __name__ == "__main__":
     # Load the transcription model once at the very start to save time
     print(f"⚙️ Loading transcription model 'small'. Please wait...")
     try:
-        transcription_model = WhisperModel("small", device="cpu", compute_type="int8")
+        physical_cores = psutil.cpu_count(logical=False) or os.cpu_count()
+        transcription_model = WhisperModel(
+            prefetch_model("small"), device="cpu", compute_type="int8",
+            cpu_threads=physical_cores, num_workers=2
+        )
         print("✅ Model loaded successfully.")
     except Exception as e:
         print(f"❌ Critical Error: Could not load the transcription model: {e}", file=sys.stderr)
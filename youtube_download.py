@@ -6,84 +6,188 @@ import sys
 import os
 import tempfile
 import subprocess
+import queue
+import threading
+import functools
 from pathlib import Path
+from typing import Iterable, Iterator
+import numpy as np
+import ctranslate2
 import yt_dlp
-from faster_whisper import WhisperModel
-from pydub import AudioSegment
+from faster_whisper import WhisperModel, BatchedInferencePipeline
+from transcribe_common import with_lookahead
 
 # --- Configuration for PyInstaller ---
 IS_BUNDLED = getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS')
 BASE_PATH = Path(sys.executable).parent if IS_BUNDLED else Path(__file__).parent
 FFMPEG_PATH = BASE_PATH / "ffmpeg.exe"
-if FFMPEG_PATH.exists():
-    AudioSegment.converter = str(FFMPEG_PATH)
+# ffmpeg can't appear or disappear while the app runs, so this is checked once.
+FFMPEG_AVAILABLE = FFMPEG_PATH.exists()
+MODEL_CACHE_PATH = BASE_PATH / "whisper-models"
 
 # --- Transcription Logic ---
+def cuda_usable() -> bool:
+    """
+    True if CTranslate2 sees an NVIDIA GPU that can run float16. This only proves the
+    driver is there; the CUDA libraries themselves are checked by load_model() actually
+    loading and warming up the model.
+    """
+    try:
+        return ctranslate2.get_cuda_device_count() > 0 and "float16" in ctranslate2.get_supported_compute_types("cuda")
+    except Exception:
+        return False
+
+def cpu_compute_type() -> str:
+    """The first int8 variant this CPU supports, falling back to float32."""
+    supported = ctranslate2.get_supported_compute_types("cpu")
+    for compute_type in ("int8_bfloat16", "int8_float16", "int8"):
+        if compute_type in supported:
+            return compute_type
+    return "float32"
+
 def format_timestamp(seconds: float) -> str:
-    assert seconds >= 0, "non-negative timestamp expected"
-    milliseconds = round(seconds * 1000.0)
-    hours, milliseconds = divmod(milliseconds, 3_600_000)
-    minutes, milliseconds = divmod(milliseconds, 60_000)
-    seconds, milliseconds = divmod(milliseconds, 1_000)
-    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}"
-
-def transcribe_video_final(video_file: str, model: WhisperModel):
+    # Whisper timestamps are never negative, so int(x + 0.5) rounds correctly and is cheaper than round().
+    ms = int(seconds * 1000.0 + 0.5)
+    h, ms = ms // 3_600_000, ms % 3_600_000
+    m, ms = ms // 60_000, ms % 60_000
+    s, ms = ms // 1_000, ms % 1_000
+    return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
+
+# ffmpeg's stdout is read in 1 MiB chunks straight into the sample buffer.
+READ_CHUNK = 1 << 20
+
+@functools.cache
+def audio_resampler() -> str:
+    """Uses the SoX resampler if this ffmpeg build includes it, otherwise ffmpeg's own swr. Checked once."""
+    try:
+        proc = subprocess.run([str(FFMPEG_PATH), "-hide_banner", "-version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except OSError:
+        return "swr"
+    return "soxr" if b"--enable-libsoxr" in proc.stdout else "swr"
+
+def extract_audio(video_file: str) -> np.ndarray:
+    """Decodes the audio track to 16kHz mono float32 samples in one ffmpeg pass, without a temp WAV."""
+    command = [
+        str(FFMPEG_PATH), "-loglevel", "error", "-threads", "0", "-i", video_file,
+        "-vn", "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1",
+        "-af", f"aresample=resampler={audio_resampler()}", "-ar", "16000", "-"
+    ]
+    # Room for ten minutes to start with, doubled whenever it fills up. Only ffmpeg.exe
+    # ships with the app, so there is no ffprobe to ask for the exact duration.
+    buf = np.empty(16000 * 600, dtype=np.int16)
+    off = 0
+    # stderr goes to a file so a chatty ffmpeg can never block on a full pipe while we read stdout.
+    with tempfile.TemporaryFile() as err, subprocess.Popen(command, stdout=subprocess.PIPE, stderr=err, bufsize=READ_CHUNK) as proc:
+        while True:
+            if off == buf.nbytes:
+                grown = np.empty(2 * buf.size, dtype=np.int16)
+                grown[:buf.size] = buf
+                buf = grown
+            n = proc.stdout.readinto(memoryview(buf).cast('B')[off:off + READ_CHUNK])
+            if not n: break
+            off += n
+        proc.wait()
+        if proc.returncode:
+            err.seek(0)
+            raise subprocess.CalledProcessError(proc.returncode, command, stderr=err.read())
+    # One float32 copy, scaled in place by the reciprocal instead of dividing into another array.
+    audio = buf[:off // 2].astype(np.float32)
+    audio *= 1.0 / 32768.0
+    return audio
+
+def split_words(words: Iterable, max_chars: int = 45, max_pause_duration: float = 0.8) -> Iterator[tuple[float, float, str]]:
+    """
+    Groups a stream of words into (start, end, text) lines. A line ends on '.', '?' or '!', before
+    a pause longer than max_pause_duration, or once the line is longer than max_chars -
+    unless one of the next three words ends the sentence anyway.
+    """
+    line_texts, line_start = [], 0.0
+    # Running length of " ".join(line_texts).
+    line_length = -1
+    # Every word is stripped and classified once, as it enters the look-ahead window.
+    prepared_words = ((w, t, t.endswith(('.', '?', '!'))) for w in words for t in [w.word.strip()])
+    for (word, text, is_terminal), following in with_lookahead(prepared_words, 3):
+        if not line_texts: line_start = word.start
+        line_texts.append(text)
+        line_length += len(text) + 1
+        should_break = (
+            is_terminal or
+            (bool(following) and following[0][0].start - word.end > max_pause_duration) or
+            (line_length > max_chars and not any(ahead[2] for ahead in following))
+        )
+        if should_break or not following:
+            yield line_start, word.end, " ".join(line_texts)
+            line_texts, line_length = [], -1
+
+def emit_cues(segments: Iterable, max_chars: int = 45, max_pause_duration: float = 0.8) -> Iterator[str]:
+    """
+    Turns Whisper's segments into numbered SRT cues. A segment that fits on one line becomes
+    a cue as it is; only longer ones are split word by word with split_words(). This relies on
+    sentence-level segments, so transcribe with without_timestamps=False.
+    """
+    srt_counter = 1
+    for segment in segments:
+        text = segment.text.strip()
+        if not text: continue
+        if len(text) <= max_chars or not segment.words:
+            lines = [(segment.start, segment.end, text)]
+        else:
+            lines = split_words(segment.words, max_chars, max_pause_duration)
+        for start, end, line_text in lines:
+            yield f"{srt_counter}\n{format_timestamp(start)} --> {format_timestamp(end)}\n{line_text}\n\n"
+            srt_counter += 1
+
+def transcribe_video_final(video_file: str, model: BatchedInferencePipeline):
     video_path = Path(video_file)
     if not video_path.is_file():
         print(f"❌ Error: Transcriber could not find file at {video_path}", file=sys.stderr)
         return
-    if not FFMPEG_PATH.exists():
-        print(f"❌ Error: ffmpeg.exe not found at {FFMPEG_PATH}", file=sys.stderr)
-        print("   Please make sure ffmpeg.exe is in the same folder as the application.", file=sys.stderr)
-        return
 
     print(f"\n▶️ STEP 2: Starting transcription for: {video_path.name}")
     print("🔊 Extracting audio from video...")
-    temp_audio_path = None
     try:
-        audio_segment = AudioSegment.from_file(video_file, format=video_path.suffix.lstrip('.'))
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp_audio_file:
-            temp_audio_path = tmp_audio_file.name
-            audio_segment.export(temp_audio_path, format="wav", parameters=["-ar", "16000", "-ac", "1"])
+        audio = extract_audio(video_file)
+    except subprocess.CalledProcessError as e:
+        print(f"❌ Error extracting audio from {video_path.name}: {e.stderr.decode('utf-8', errors='replace').strip()}", file=sys.stderr)
+        return
     except Exception as e:
         print(f"❌ Error extracting audio from {video_path.name}: {e}", file=sys.stderr)
-        if temp_audio_path and os.path.exists(temp_audio_path): os.remove(temp_audio_path)
         return
 
     print("🤖 Transcribing... (This will take some time)")
-    srt_content = ""
+    segments, info = model.transcribe(
+        audio,
+        batch_size=8,
+        word_timestamps=True,
+        # The batched pipeline otherwise returns each VAD chunk (up to 30s) as one segment;
+        # with timestamp tokens Whisper splits it into sentence-sized segments, which
+        # emit_cues() can usually take over as cues without per-word work.
+        without_timestamps=False,
+        # Greedy decoding without fallback temperatures or cross-window prompting:
+        # one decoder pass per chunk.
+        beam_size=1,
+        best_of=1,
+        temperature=0.0,
+        condition_on_previous_text=False,
+        vad_filter=True,
+        # Ignore blips under 250ms, which only cost a decoder run on near-silence.
+        vad_parameters=dict(min_speech_duration_ms=250, threshold=0.5, min_silence_duration_ms=500)
+    )
+    print(f"🌍 Detected language '{info.language}' with {info.language_probability:.2f} probability.")
+    # Segments are decoded lazily: cues are written while Whisper is still working,
+    # and only the current segment is ever held in memory.
+    output_path = video_path.with_suffix(".srt")
+    srt_file = None
     try:
-        segments, info = model.transcribe(
-            temp_audio_path,
-            word_timestamps=True,
-            vad_filter=True,
-            vad_parameters=dict(min_speech_duration_ms=50, threshold=0.4)
-        )
-        print(f"🌍 Detected language '{info.language}' with {info.language_probability:.2f} probability.")
-        all_words = [word for segment in segments for word in segment.words]
-        if all_words:
-            srt_counter, max_chars, max_pause_duration, line_buffer = 1, 45, 0.8, []
-            for i, word in enumerate(all_words):
-                line_buffer.append(word)
-                current_text = " ".join([w.word.strip() for w in line_buffer])
-                is_last_word = (i == len(all_words) - 1)
-                should_break = False
-                if word.word.strip().endswith(('.', '?', '!')): should_break = True
-                elif not is_last_word and (all_words[i+1].start - word.end > max_pause_duration): should_break = True
-                elif len(current_text) > max_chars:
-                    if not any(w.word.strip().endswith(('.', '?', '!')) for w in all_words[i+1:i+4]): should_break = True
-                if is_last_word or should_break:
-                    start_time = format_timestamp(line_buffer[0].start)
-                    end_time = format_timestamp(line_buffer[-1].end)
-                    text = " ".join([w.word.strip() for w in line_buffer])
-                    srt_content += f"{srt_counter}\n{start_time} --> {end_time}\n{text}\n\n"
-                    srt_counter, line_buffer = srt_counter + 1, []
-    finally:
-        if temp_audio_path and os.path.exists(temp_audio_path): os.remove(temp_audio_path)
-
-    if srt_content:
-        output_path = video_path.with_suffix(".srt")
-        output_path.write_text(srt_content, encoding='utf-8')
+        for cue in emit_cues(segments):
+            if srt_file is None: srt_file = output_path.open("w", encoding="utf-8", buffering=1 << 20)
+            srt_file.write(cue)
+    except BaseException:
+        # A half-written SRT must not be picked up by the embedding step.
+        if srt_file is not None: srt_file.close(); output_path.unlink()
+        raise
+    if srt_file is not None:
+        srt_file.close()
         print("--- Transcription Complete ---")
         print(f"✅ Subtitle file saved to: {output_path}")
     else:
@@ -99,33 +203,39 @@ def embed_subtitles(video_path: str, srt_path: str):
         '-c', 'copy', '-c:s', 'mov_text',
         '-metadata:s:s:0', 'language=deu',
         '-disposition:s:0', 'default',  # <-- THIS IS THE NEW FLAG
+        '-movflags', '+faststart',  # index at the front, so players can start before the file is fully read
         '-y', str(output_p)
     ]
     try:
         print("🔩 Running ffmpeg command...")
-        subprocess.run(command, check=True, capture_output=True, text=True, encoding='utf-8')
+        # Only stderr is kept, as raw bytes, for the error message; ffmpeg prints nothing useful on stdout.
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, bufsize=1 << 20)
         print("✅ Subtitles embedded successfully.")
-        os.remove(video_p); os.remove(srt_p); os.rename(output_p, video_p)
+        # replace() overwrites the original in one atomic rename (same folder, same drive).
+        srt_p.unlink(); output_p.replace(video_p)
         print(f"✅ Final video saved to: {video_p}")
     except FileNotFoundError:
         print(f"\n❌ Error: '{FFMPEG_PATH}' command not found.", file=sys.stderr)
     except subprocess.CalledProcessError as e:
         print("\n❌ An error occurred with ffmpeg:", file=sys.stderr)
-        print(f"FFmpeg stderr:\n{e.stderr}", file=sys.stderr)
+        print(f"FFmpeg stderr:\n{e.stderr.decode('utf-8', errors='replace')}", file=sys.stderr)
         if output_p.exists(): os.remove(output_p)
 
 # --- YouTube Download Logic ---
 def download_video(url: str) -> str | None:
     print(f"▶️ STEP 1: Starting download for URL: {url}")
+    # No running percentage: the URL prompt stays open while videos download, and a
+    # '\r' progress line would keep overwriting whatever the user is typing there.
     def progress_hook(d):
-        if d['status'] == 'downloading':
-            print(f"\rDownloading: {d.get('_percent_str', '0.0%').strip()} at {d.get('_speed_str', 'N/A')}", end='')
-        elif d['status'] == 'finished':
-            print("\nDownload finished, post-processing...")
+        if d['status'] == 'finished':
+            print("Download finished, post-processing...")
     ydl_opts = {
         'format': 'bestvideo[ext=mp4][height<=1080]+bestaudio[ext=m4a]/best[ext=mp4]/best',
         'outtmpl': os.path.join(BASE_PATH, 'recordings', '%(title)s.%(ext)s'),
-        'progress_hooks': [progress_hook], 'noplaylist': True, 'merge_output_format': 'mp4',
+        'progress_hooks': [progress_hook], 'noprogress': True, 'noplaylist': True, 'merge_output_format': 'mp4',
+        # Fetch DASH/HLS fragments in parallel and large files in 10 MB ranges.
+        'concurrent_fragment_downloads': 8, 'http_chunk_size': 10_485_760,
+        'retries': 3, 'fragment_retries': 5,
     }
     try:
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
@@ -135,44 +245,121 @@ def download_video(url: str) -> str | None:
         print(f"\n❌ An unexpected error occurred: {e}")
         return None
 
+# --- Pipeline ---
+# Each video moves through three worker threads (download -> transcribe -> embed), so the
+# next video can download while the previous one is transcribed and the one before is muxed.
+# Set while main() waits at the URL prompt, so the stages know their output has pushed it up.
+prompt_showing = threading.Event()
+
+def run_stage(inbox: queue.Queue, outbox: queue.Queue | None, work):
+    """Passes every item from inbox through work() and forwards non-None results. None shuts the stage down."""
+    while (item := inbox.get()) is not None:
+        # Start below the prompt instead of on the line the user is typing in.
+        if prompt_showing.is_set(): print()
+        try:
+            result = work(item)
+        except Exception as e:
+            print(f"\n❌ An unexpected error occurred: {e}", file=sys.stderr)
+            print("   Please try another link or restart the script.")
+            result = None
+        if outbox is not None and result is not None: outbox.put(result)
+        # Show the prompt again below this stage's output; anything already typed is still in the input buffer.
+        if prompt_showing.is_set(): print("\nURL: ", end='', flush=True)
+    if outbox is not None: outbox.put(None)
+
+def download_step(url: str) -> str | None:
+    video_file = download_video(url)
+    if video_file and os.path.exists(video_file): return video_file
+    print(f"\n❌ Download failed. Check URL and connection.")
+    return None
+
+def load_on(device: str, compute_type: str) -> BatchedInferencePipeline:
+    """Loads the 'base' model on one device and warms it up, so any missing library fails here."""
+    print(f"\n⚙️ Loading transcription model 'base' ({device}, {compute_type}). Please wait...")
+    print("   (This may download several hundred MB on the first run)")
+    model_options = dict(
+        device=device,
+        compute_type=compute_type,
+        cpu_threads=max(4, (os.cpu_count() or 1) // 2),
+        num_workers=1,
+        download_root=str(MODEL_CACHE_PATH)
+    )
+    try:
+        # Once the model is in MODEL_CACHE_PATH, load it without asking the Hugging Face Hub.
+        transcription_model = WhisperModel("base", local_files_only=True, **model_options)  # multi-language model
+    except Exception:
+        transcription_model = WhisperModel("base", **model_options)
+    # Runs the VAD-split 30s chunks through the model in batches of 8. Only the
+    # transcription thread uses it, one video at a time, so a single pipeline is enough.
+    batched_model = BatchedInferencePipeline(model=transcription_model)
+    # Warm-up: one second of silence goes through language detection, decoding and word
+    # alignment, so the first real video doesn't pay for the lazy allocations.
+    segments, _ = batched_model.transcribe(np.zeros(16000, np.float32), word_timestamps=True, without_timestamps=False, vad_filter=False)
+    for _ in segments: pass
+    print("✅ Model loaded successfully.")
+    return batched_model
+
+@functools.cache
+def load_model() -> BatchedInferencePipeline:
+    """
+    Loads the model the first time a video needs it rather than at startup, so typing 'exit'
+    right away costs nothing. A failed load isn't cached, so the next video tries again.
+    """
+    if cuda_usable():
+        try:
+            return load_on("cuda", "float16")
+        except Exception as e:
+            # Typically cuBLAS/cuDNN missing: the driver alone makes the GPU visible,
+            # but CTranslate2 doesn't ship the CUDA libraries.
+            print(f"⚠️ Could not use the GPU ({e}). Falling back to the CPU.", file=sys.stderr)
+    return load_on("cpu", cpu_compute_type())
+
+def transcribe_step(video_file: str) -> str | None:
+    try:
+        model = load_model()
+    except Exception as e:
+        print(f"❌ Critical Error: Could not load model: {e}", file=sys.stderr)
+        return None
+    transcribe_video_final(video_file, model=model)
+    if Path(video_file).with_suffix(".srt").is_file(): return video_file
+    print("\n❌ Subtitle file not created, skipping embedding.")
+    return None
+
+def embed_step(video_file: str):
+    embed_subtitles(video_file, str(Path(video_file).with_suffix(".srt")))
+    print("\n🎉 Task complete. Ready for the next link.")
+
 # --- Main Execution ---
 if __name__ == "__main__":
-    MODEL_CACHE_PATH = BASE_PATH / "whisper-models"
     print("="*60)
     print("      YouTube Subtitle Downloader")
     print("="*60)
-    print(f"⚙️ Loading transcription model 'base'. Please wait...")
-    print("   (This may download several hundred MB on the first run)")
-    try:
-        transcription_model = WhisperModel(
-            "base", # Using the multi-language model
-            device="cpu",
-            compute_type="int8",
-            download_root=str(MODEL_CACHE_PATH)
-        )
-        print("✅ Model loaded successfully.")
-    except Exception as e:
-        print(f"❌ Critical Error: Could not load model: {e}", file=sys.stderr)
+    if not FFMPEG_AVAILABLE:
+        print(f"❌ Error: ffmpeg.exe not found at {FFMPEG_PATH}", file=sys.stderr)
+        print("   Please make sure ffmpeg.exe is in the same folder as the application.", file=sys.stderr)
         input("Press Enter to exit.")
         sys.exit(1)
-    
+
+    download_q, transcribe_q, embed_q = (queue.Queue(maxsize=2) for _ in range(3))
+    workers = [
+        threading.Thread(target=run_stage, args=(download_q, transcribe_q, download_step), daemon=True),
+        threading.Thread(target=run_stage, args=(transcribe_q, embed_q, transcribe_step), daemon=True),
+        threading.Thread(target=run_stage, args=(embed_q, None, embed_step), daemon=True),
+    ]
+    for worker in workers: worker.start()
+
     while True:
         print("\n" + "="*60)
-        print("🔗 Paste a YouTube URL and press Enter to begin.")
+        print("🔗 Paste a YouTube URL and press Enter to begin. You can queue more while it works.")
         print("   (Type 'exit' or close the window to quit)")
+        prompt_showing.set()
         url = input("URL: ").strip()
+        prompt_showing.clear()
         if url.lower() in ['exit', 'quit']: break
         if not url: continue
-        try:
-            video_file = download_video(url)
-            if video_file and os.path.exists(video_file):
-                transcribe_video_final(video_file, model=transcription_model)
-                video_path, srt_path = Path(video_file), Path(video_file).with_suffix(".srt")
-                if srt_path.is_file():
-                    embed_subtitles(str(video_path), str(srt_path))
-                    print("\n🎉 Task complete. Ready for the next link.")
-                else: print("\n❌ Subtitle file not created, skipping embedding.")
-            else: print(f"\n❌ Download failed. Check URL and connection.")
-        except Exception as e:
-            print(f"\n❌ An unexpected error occurred: {e}", file=sys.stderr)
-            print("   Please try another link or restart the script.")
+        download_q.put(url)
+
+    # Let the videos already in the pipeline finish before exiting.
+    download_q.put(None)
+    print("⏳ Finishing any queued videos...")
+    for worker in workers: worker.join()